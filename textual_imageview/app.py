@@ -17,6 +17,14 @@ class ImageViewerApp(App):
 
     TITLE = "vimg"
 
+    # With draft enabled, JPEGs are downscaled while decoding to no smaller than this
+    # size (w,h)
+    DRAFT_SIZE = (2048, 2048)
+
+    # Seconds after the last zoom key press before the preview is replaced by a full
+    # quality resize
+    ZOOM_SETTLE_DELAY = 0.15
+
     BINDINGS = [
         Binding("ctrl+c", "quit", "Quit", priority=True),
         # Movement
@@ -35,11 +43,15 @@ class ImageViewerApp(App):
         Binding("Q,_", "zoom(2)", "Fast Zoom Out", show=False),
     ]
 
-    def __init__(self, image_path: Union[str, Path]):
+    def __init__(self, image_path: Union[str, Path], draft: bool = False):
         """Inits vimg
 
         Args:
             image_path (Path or str): Path of image to view.
+            draft (bool): If True, large JPEGs are decoded at a reduced resolution no
+                smaller than DRAFT_SIZE. This speeds up loading and zooming, but the
+                highest zoom level no longer shows the image's native pixels.
+                Defaults to False.
         """
         super().__init__()
         image_path = Path(image_path)
@@ -49,18 +61,62 @@ class ImageViewerApp(App):
 
         self.sub_title = image_path.name
         self.image = Image.open(image_path)
+        if draft and self.image.format == "JPEG":
+            # Let libjpeg scale down the image as it decodes. Every zoom level is
+            # resized from this image, so a smaller source makes zooming cheaper.
+            self.image.draft("RGB", self.DRAFT_SIZE)
         self.image_viewer = ImageViewer(self.image)
 
+        # Key presses that arrive before the next refresh are applied together
+        self._pending_move = (0, 0)
+        self._pending_zoom = 0
+        self._flush_scheduled = False
+        self._zoom_generation = 0
+
     def action_move(self, delta_x: int, delta_y: int):
-        self.image_viewer.image.move(delta_x, delta_y)
-        self.image_viewer.refresh()
-        self.refresh()
+        pending_x, pending_y = self._pending_move
+        self._pending_move = (pending_x + delta_x, pending_y + delta_y)
+        self._schedule_flush()
 
     def action_zoom(self, delta: int):
-        self.image_viewer.image.zoom(delta)
+        self._pending_zoom += delta
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.call_after_refresh(self._flush)
+
+    def _flush(self):
+        """Applies all pending moves and zooms, then refreshes once."""
+        self._flush_scheduled = False
+
+        if self._pending_move != (0, 0):
+            self.image_viewer.image.move(*self._pending_move)
+            self._pending_move = (0, 0)
+
+        if self._pending_zoom != 0:
+            # Resizing is the slow part of zooming, so use a cheap preview while keys
+            # are held down and resize at full quality once they're released
+            self.image_viewer.image.zoom(self._pending_zoom, quality=False)
+            self._pending_zoom = 0
+            self._zoom_generation += 1
+            generation = self._zoom_generation
+            self.set_timer(
+                self.ZOOM_SETTLE_DELAY, lambda: self._settle_zoom(generation)
+            )
+
         self.image_viewer.refresh()
         self.refresh()
 
+    def _settle_zoom(self, generation: int):
+        # Skip if there have been more zooms since this one was scheduled
+        if generation != self._zoom_generation:
+            return
+
+        self.image_viewer.image.zoom(0, quality=True)
+        self.image_viewer.refresh()
+
     def compose(self) -> ComposeResult:
         yield Header()
         yield self.image_viewer
@@ -71,6 +127,14 @@ def vimg():
     """CLI entry point"""
     parser = ArgumentParser(description="A simple terminal-based image viewer.")
     parser.add_argument("image_path", help="Path of image to view.")
+    parser.add_argument(
+        "--draft",
+        help=(
+            "Decode large JPEGs at a reduced resolution for faster loading and "
+            "zooming. The highest zoom level no longer shows native pixels."
+        ),
+        action="store_true",
+    )
     parser.add_argument(
         "-v",
         "--version",
@@ -81,5 +145,5 @@ def vimg():
 
     args = parser.parse_args()
 
-    app = ImageViewerApp(args.image_path)
+    app = ImageViewerApp(args.image_path, draft=args.draft)
     app.run()
@@ -1,6 +1,14 @@
+import logging
 import math
-from typing import Optional, Tuple
-
+import sys
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import compress, islice
+from operator import ne
+from typing import List, Optional, Set, Tuple
+
+import PIL
 from PIL import Image
 from rich.color import Color
 from rich.console import Console, ConsoleOptions, RenderResult
@@ -8,18 +16,78 @@ from rich.segment import Segment
 from rich.style import Style
 
 Zoom = int
+# A pair of vertically adjacent pixels packed into one int: the upper pixel in the high
+# 32 bits, and the lower pixel in the low 32 bits. Pixels are packed RGBX values, which
+# are never 0 because Pillow pads X with 255, so 0 marks a pixel outside of the image.
+PixelPair = int
+RenderKey = Tuple[Zoom, Tuple[int, int], Tuple[int, int]]
+
+logger = logging.getLogger(__name__)
+
+# Channel intensities of the 6x6x6 color cube in the 256-color palette, and a table
+# mapping each 8-bit channel value to the index of the nearest intensity
+_CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+_CUBE_TABLE = bytes(
+    min(range(6), key=lambda i: abs(_CUBE_LEVELS[i] - value)) for value in range(256)
+)
+
+_NEWLINE = Segment("\n", Style.null())
+
+
+@lru_cache(maxsize=256)
+def _padding(width: int) -> Segment:
+    """Creates a blank Segment that is width characters long."""
+    return Segment(" " * width, Style.null())
+
+
+def _make_color(pixel: int, truecolor: bool) -> Color:
+    """Converts a pixel from a pixel buffer into a Rich Color.
+
+    Args:
+        pixel (int): Packed RGBX value of the pixel, or of the color cube indices of the
+            pixel if truecolor is disabled.
+        truecolor (bool): Whether the pixel buffer holds RGB values.
+    """
+    r, g, b, _ = pixel.to_bytes(4, sys.byteorder)
+    if truecolor:
+        return Color.from_rgb(r, g, b)
+
+    return Color.from_ansi(16 + 36 * r + 6 * g + b)
+
+
+@lru_cache(maxsize=8192)
+def _make_style(color: int, bgcolor: int, truecolor: bool) -> Style:
+    """Creates the Style for a foreground and background pixel. Styles are memoized
+    because Rich normalizes each Color and Style on instantiation.
+
+    Args:
+        color (int): Foreground pixel, or 0 for the default color.
+        bgcolor (int): Background pixel, or 0 for the default color.
+        truecolor (bool): Whether the pixels hold RGB values or color cube indices.
+    """
+    return Style(
+        color=_make_color(color, truecolor) if color else None,
+        bgcolor=_make_color(bgcolor, truecolor) if bgcolor else None,
+    )
 
 
 class ImageView:
     """Renders an image with zoom and padding.
 
     Args:
-        image (Image.Image): PIL image to render.
+        image (Image.Image): PIL image to render. Converted to RGB if necessary.
         zoom (int): Zoom level. Must be non-negative. Zoom increase -> zoom out.
         origin_position (Tuple[int, int]): Image position (x,y) of the top-left corner
             of the container. Defaults to (0,0).
         container_size (Tuple[int, int], optional): Size of the container of the image
             (w,h). If None, nothing is rendered. Defaults to None.
+        resample (Image.Resampling, optional): Resampling filter used to resize the
+            image for each zoom level. If None, BOX is used when shrinking the image and
+            BILINEAR otherwise, which are cheap and look the same at terminal
+            resolution. Defaults to None.
+        truecolor (bool): If False, colors are quantized to the 6x6x6 color cube of
+            the 256-color palette. Far fewer unique pixel pairs are then rendered,
+            which improves the hit rate of the segment cache. Defaults to True.
 
     Notes:
         Throughout this class, "image position" refers to the coordinate frame with the
@@ -29,6 +97,7 @@ class ImageView:
     """
 
     ZOOM_RATE = 0.8
+    SEGMENT_CACHE_SIZE = 65536
 
     def __init__(
         self,
@@ -36,17 +105,38 @@ class ImageView:
         zoom: int = 0,
         origin_position: Tuple[int, int] = (0, 0),
         container_size: Optional[Tuple[int, int]] = None,
+        resample: Optional[Image.Resampling] = None,
+        truecolor: bool = True,
     ):
-        self.images: dict[Zoom, Image.Image] = {}
-        self.segment_cache: dict[Zoom, dict[Tuple[int, int], Segment]] = {}
-
-        self.image = image
+        # Pillow-SIMD reports versions with a ".postN" suffix
+        logger.debug("Using Pillow %s", PIL.__version__)
+
+        self._mips: List[Image.Image] = []
+        # Only the raw pixels and size of each zoom level are kept, as the resized PIL
+        # images are not needed once their pixels have been extracted
+        self._pixel_bufs: dict[Zoom, array] = {}
+        self._sizes: dict[Zoom, Tuple[int, int]] = {}
+        self._previews: Set[Zoom] = set()
+        self.segment_cache: OrderedDict[PixelPair, Segment] = OrderedDict()
+        self._render_cache: Optional[Tuple[RenderKey, List[Segment]]] = None
+
+        # Convert once up front so that every zoomed image is RGB. Any alpha channel is
+        # dropped.
+        self.image = image.convert("RGB") if image.mode != "RGB" else image
+        self._mips.append(self.image)
         self._container_size = container_size
+        self.resample = resample
+        self._truecolor = truecolor
         self._zoom = 0
         self.set_zoom(zoom)
         self.origin_position = origin_position
 
-    def zoom(self, delta: int, zoom_position: Optional[Tuple[int, int]] = None):
+    def zoom(
+        self,
+        delta: int,
+        zoom_position: Optional[Tuple[int, int]] = None,
+        quality: bool = True,
+    ):
         """Adjusts the zoom level of the image at the specified zoom image position. If
         no zoom position is specified, the center of the console is used.
 
@@ -54,10 +144,17 @@ class ImageView:
             zoom: Zoom delta. Postivie -> zoom out.
             zoom_position: Image-space position (x,y) to zoom into. Conceptually, the
                 pixel at this image will not move no matter the zoom level.
+            quality: If False, a new zoom level is resized with NEAREST resampling
+                until it is requested again with quality=True.
         """
-        self.set_zoom(self._zoom + delta, zoom_position=zoom_position)
+        self.set_zoom(self._zoom + delta, zoom_position=zoom_position, quality=quality)
 
-    def set_zoom(self, zoom: int, zoom_position: Optional[Tuple[int, int]] = None):
+    def set_zoom(
+        self,
+        zoom: int,
+        zoom_position: Optional[Tuple[int, int]] = None,
+        quality: bool = True,
+    ):
         """Sets the zoom level of the image at the specified zoom image position. If
         no zoom position is specified, the center of the console is used.
 
@@ -65,21 +162,58 @@ class ImageView:
             zoom: Zoom level. Must be non-negative. Zoom increase -> zoom out.
             zoom_position: Image-space position (x,y) to zoom into. Conceptually, the
                 pixel at this image will not move no matter the zoom level.
+            quality: If False, a new zoom level is resized with NEAREST resampling,
+                which is much faster and good enough while the zoom level is changing
+                rapidly. Setting a zoom level again with quality=True replaces its
+                preview with a full quality resize.
         """
         # Lower bound on zoom
         zoom = max(zoom, 0)
 
-        # Upper bound on zoom
-        if zoom > self._zoom and min(self.zoomed_size) <= 8:
-            zoom = self._zoom
+        # Upper bound on zoom. The bound is on the zoomed size rather than the number of
+        # steps, so that a single large delta can't zoom past it.
+        if zoom > self._zoom:
+            max_zoom = self._zoom
+            while min(self._get_zoomed_size(max_zoom)) > 8:
+                max_zoom += 1
+            zoom = min(zoom, max_zoom)
+
+        resize = zoom not in self._pixel_bufs or (quality and zoom in self._previews)
 
-        if zoom not in self.images:
+        # Nothing to do, e.g. zoom key held down at either bound. Zooming to the current
+        # zoom level never moves the image, regardless of the zoom position.
+        if zoom == self._zoom and not resize:
+            return
+
+        if resize:
             multiplier = self.ZOOM_RATE**zoom
-            w, h = self.image.size
-            self.images[zoom] = self.image.resize(
-                (round(w * multiplier), round(h * multiplier))
-            )
-            self.segment_cache[zoom] = {}
+            size = self._get_zoomed_size(zoom)
+
+            # Resize from the smallest mip that is still larger than the zoomed image
+            mip = self._get_mip(int(-math.log2(multiplier)))
+            self._previews.discard(zoom)
+            if mip.size == size:
+                image = mip
+            elif not quality:
+                image = mip.resize(size, Image.Resampling.NEAREST)
+                self._previews.add(zoom)
+            else:
+                resample = self.resample
+                if resample is None:
+                    shrink = size[0] < mip.size[0]
+                    resample = (
+                        Image.Resampling.BOX if shrink else Image.Resampling.BILINEAR
+                    )
+                image = mip.resize(size, resample)
+            # Packed RGBX pixels of the zoomed image, indexed directly while rendering
+            pixels = image.convert("RGBX").tobytes()
+            if not self._truecolor:
+                pixels = pixels.translate(_CUBE_TABLE)
+            self._pixel_bufs[zoom] = array("I", pixels)
+            self._sizes[zoom] = image.size
+
+            # The last render may have used the preview being replaced
+            self._render_cache = None
 
         if self._container_size is not None:
             w, h = self._container_size
@@ -88,8 +222,8 @@ class ImageView:
                 zoom_position = origin_x + w // 2, origin_y + h
             old_zoom_x, old_zoom_y = zoom_position
 
-            old_w, old_h = self.images[self._zoom].size
-            new_w, new_h = self.images[zoom].size
+            old_w, old_h = self._sizes[self._zoom]
+            new_w, new_h = self._sizes[zoom]
 
             multiplier_x = new_w / old_w
             multiplier_y = new_h / old_h
@@ -104,6 +238,33 @@ class ImageView:
                 origin_y + round(new_zoom_y - old_zoom_y),
             )
 
+    def _get_zoomed_size(self, zoom: int) -> Tuple[int, int]:
+        """Computes the size (w,h) of the image at a zoom level.
+
+        Args:
+            zoom (int): Zoom level. Must be non-negative.
+        """
+        multiplier = self.ZOOM_RATE**zoom
+        w, h = self.image.size
+        return max(round(w * multiplier), 1), max(round(h * multiplier), 1)
+
+    def _get_mip(self, level: int) -> Image.Image:
+        """Returns the image downsampled by a factor of 2**level. Each level is computed
+        by halving the previous level, so deep zoom levels avoid resampling the
+        full-resolution image.
+
+        Args:
+            level (int): Mip level. Must be non-negative. Level 0 is the original image.
+        """
+        while len(self._mips) <= level:
+            mip = self._mips[-1]
+            w, h = mip.size
+            self._mips.append(
+                mip.resize((max(w // 2, 1), max(h // 2, 1)), Image.Resampling.BOX)
+            )
+
+        return self._mips[level]
+
     def move(self, delta_x: int, delta_y: int):
         """Moves the image using the specified delta (x,y), where +x moves the image
         right, and +y moves the image down.
@@ -210,20 +371,17 @@ class ImageView:
         else:
             w, h = 0, 0
 
-        if origin_x <= -w + 1:
-            origin_x = -w + 1
-
-        if origin_x >= img_w - 1:
-            origin_x = img_w - 1
-
-        if origin_y <= -h + 1:
-            origin_y = -h + 1
-
-        if origin_y >= img_h - 1:
-            origin_y = img_h - 1
+        origin_x = min(max(origin_x, -w + 1), img_w - 1)
+        origin_y = min(max(origin_y, -h + 1), img_h - 1)
 
         self._origin_position = origin_x, origin_y
 
+    @property
+    def truecolor(self) -> bool:
+        """Whether colors are rendered in truecolor rather than the 256-color palette.
+        Read-only, as the pixels of each zoom level are quantized on creation."""
+        return self._truecolor
+
     @property
     def size(self) -> Tuple[int, int]:
         """Size of the original image."""
@@ -232,7 +390,7 @@ class ImageView:
     @property
     def zoomed_size(self) -> Tuple[int, int]:
         """Size of the image at the current zoom level."""
-        return self.images[self._zoom].size
+        return self._sizes[self._zoom]
 
     def __rich_console__(
         self, console: Console, options: ConsoleOptions
@@ -240,40 +398,73 @@ class ImageView:
         if self._container_size is None:
             return ""
 
-        image = self.images[self._zoom]
-        img_w, img_h = image.size
+        # Parent refreshes re-render the image even if nothing about it has changed
+        key = (self._zoom, self.origin_position, self._container_size)
+        if self._render_cache is not None and self._render_cache[0] == key:
+            return self._render_cache[1]
+
+        pixels = self._pixel_bufs[self._zoom]
+        img_w, img_h = self.zoomed_size
         w, h = self._container_size[0], self._container_size[1] * 2
         origin_x, origin_y = self.origin_position
 
-        null_style = Style.null()
-        newline = Segment("\n", null_style)
+        x_start = max(origin_x, 0)
+        x_end = min(x_start + w, img_w)
 
         segments = []
+        cache_get = self.segment_cache.get
+        pair_segment = self._pair_segment
         for y in range(origin_y, min(origin_y + h, img_h), 2):
             # Skip lines with no image
             if y < -1:
-                segments.append(newline)
+                segments.append(_NEWLINE)
                 continue
 
             # Add padding to the left of the image
             if origin_x < 0:
-                segments.append(Segment(" " * -origin_x, style=null_style))
-                x_start = 0
+                segments.append(_padding(-origin_x))
+
+            # Pack each pixel pair of the line into a single int
+            start = y * img_w + x_start
+            end = y * img_w + x_end
+            if y < 0:
+                pairs = pixels[start + img_w : end + img_w]
+            elif y < img_h - 1:
+                pairs = [
+                    upper << 32 | lower
+                    for upper, lower in zip(
+                        pixels[start:end], pixels[start + img_w : end + img_w]
+                    )
+                ]
             else:
-                x_start = origin_x
-
-            for x in range(x_start, min(x_start + w, img_w)):
-                # Add segment for each pixel-pair of the image
-                segments.append(self.get_segment(x, y))
-
-            segments.append(newline)
-
+                pairs = [upper << 32 for upper in pixels[start:end]]
+
+            length = len(pairs)
+            if len(set(pairs)) * 4 > length:
+                # Detailed line: runs are rare, so add a segment per character
+                segments.extend(
+                    [cache_get(pair) or pair_segment(pair) for pair in pairs]
+                )
+            else:
+                # Flat line: add a segment for each run of identical pixel pairs, so
+                # that flat regions are styled once instead of once per character
+                run_starts = [0]
+                run_starts.extend(
+                    compress(range(1, length), map(ne, pairs, islice(pairs, 1, None)))
+                )
+                run_ends = run_starts[1:] + [length]
+                for run_start, run_end in zip(run_starts, run_ends):
+                    segments.append(
+                        self._run_segment(pairs[run_start], run_end - run_start)
+                    )
+
+            segments.append(_NEWLINE)
+
+        self._render_cache = (key, segments)
         return segments
 
     def get_segment(self, x: int, y: int) -> Segment:
         """Computes the Segment (character + style) at a particular image position.
-        Segments are cached because profiling suggested that the instantiation of Color
-        and Style objects was taxing.
 
         Args:
             x (int): Image x-coordinate of returned segment.
@@ -281,34 +472,56 @@ class ImageView:
                 refers to the top half of the segment, as each character corresponds to
                 two pixels.
         """
-        position = (x, y)
-        image = self.images[self._zoom]
-        cache = self.segment_cache[self._zoom]
-        _, img_h = image.size
-
-        # Check if we've already computed the segment for this position
-        if position not in cache:
-            upper = None
-            if y >= 0:
-                pixel = image.getpixel(position)
-                if not isinstance(pixel, tuple):
-                    pixel = (pixel, pixel, pixel)
-                upper = Color.from_rgb(*pixel[:3])
-
-            lower = None
-            if y < img_h - 1:
-                pixel = image.getpixel((x, y + 1))
-                if not isinstance(pixel, tuple):
-                    pixel = (pixel, pixel, pixel)
-                lower = Color.from_rgb(*pixel[:3])
-
-            # Render each pixel as a half-height character
-            if upper is None:
-                segment = Segment("▄", Style(color=lower))
+        pixels = self._pixel_bufs[self._zoom]
+        img_w, img_h = self.zoomed_size
+
+        i = y * img_w + x
+        upper = pixels[i] if y >= 0 else 0
+        lower = pixels[i + img_w] if y < img_h - 1 else 0
+        return self._pair_segment(upper << 32 | lower)
+
+    def _run_segment(self, pair: PixelPair, length: int) -> Segment:
+        """Returns a Segment that renders the same pixel pair for several consecutive
+        characters.
+
+        Args:
+            pair (PixelPair): Packed top and bottom pixels.
+            length (int): Number of characters in the run.
+        """
+        segment = self.segment_cache.get(pair) or self._pair_segment(pair)
+        if length == 1:
+            return segment
+
+        text, style, _ = segment
+        return Segment(text * length, style)
+
+    def _pair_segment(self, pair: PixelPair) -> Segment:
+        """Returns the Segment for a pair of vertically adjacent pixels. Segments are
+        cached by pixel content rather than position, so identical pixel pairs anywhere
+        in the image, at any zoom level, share one Segment. Profiling suggested that the
+        instantiation of Color and Style objects was taxing. The oldest segment is
+        evicted once the cache holds SEGMENT_CACHE_SIZE segments.
+
+        Args:
+            pair (PixelPair): Packed top and bottom pixels. Either pixel is 0 if that
+                half of the character lies outside of the image.
+        """
+        cache = self.segment_cache
+
+        # Check if we've already computed the segment for this pixel pair
+        segment = cache.get(pair)
+        if segment is None:
+            upper, lower = pair >> 32, pair & 0xFFFFFFFF
+
+            # Render each pixel pair as a half-height character
+            if not upper:
+                segment = Segment("▄", _make_style(lower, 0, self._truecolor))
             else:
-                segment = Segment("▀", Style(color=upper, bgcolor=lower))
+                segment = Segment("▀", _make_style(upper, lower, self._truecolor))
 
-            # Cache segment for next render
-            cache[position] = segment
+            # Cache segment for next render, evicting the oldest segment if full
+            cache[pair] = segment
+            if len(cache) > self.SEGMENT_CACHE_SIZE:
+                cache.popitem(last=False)
 
-        return cache[position]
+        return segment
@@ -1,4 +1,5 @@
 import math
+from typing import Optional
 
 from PIL import Image
 from textual import events
@@ -16,14 +17,28 @@ class ImageViewer(Widget):
     }
     """
 
-    def __init__(self, image: Image.Image):
+    def __init__(
+        self,
+        image: Image.Image,
+        resample: Optional[Image.Resampling] = None,
+        truecolor: bool = True,
+    ):
+        """Inits ImageViewer
+
+        Args:
+            image (Image.Image): PIL image to view.
+            resample (Image.Resampling, optional): Resampling filter used to resize the
+                image for each zoom level. See ImageView. Defaults to None.
+            truecolor (bool): If False, colors are quantized to the 256-color palette.
+                See ImageView. Defaults to True.
+        """
         super().__init__()
         if not isinstance(image, Image.Image):
             raise TypeError(
                 f"Expected PIL Image, but received '{type(image).__name__}' instead."
             )
 
-        self.image = ImageView(image)
+        self.image = ImageView(image, resample=resample, truecolor=truecolor)
         self.mouse_down = False
 
     def on_show(self):